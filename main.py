@@ -1,11 +1,11 @@
-import uuid, time, os, signal, json, itertools
+import itertools, time, os, signal, json, bisect, mmap, heapq
 import asyncio, uvicorn
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import StreamingResponse, HTMLResponse
-from fastapi import WebSocket
+from fastapi import WebSocket, WebSocketDisconnect
 from threading import Thread, Lock, Event
 from collections import deque
 
@@ -25,7 +25,9 @@ class Watchdog:
         self.death = 15
         self.running = False
 
-        self.__proccesses = []
+        self.__processes: dict[int, float] = {} # id -> last heartbeat, -1 if it hasn't beat yet (or is idle)
+        self.__expiries: list[tuple[float, int]] = [] # (earliest time it could be dead, id). see `watch`
+        self.__scheduled: dict[int, float] = {} # id -> the deadline it has in `__expiries`, so each process has at most one entry there
         self.__mod_lock = Lock()
 
     @property
@@ -33,62 +35,96 @@ class Watchdog:
         """
         The amount of processes the Watchdog is aware of.
         """
-        return len(self.__proccesses)
+        return len(self.__processes)
 
-    def beat(self, id: str) -> None:
+    def beat(self, id: int) -> None:
         """
         Process heartbeat. Should be called every iteration to prove the thread is
         still alive.
         """
+        with self.__mod_lock:
+            previous = self.__processes.get(id)
+            if previous is None: # don't resurrect a process the watchdog already removed
+                return
 
-        proc = [_ for _ in self.__proccesses if _["id"] == id][0]
+            now = time.time()
+            self.__processes[id] = now
+            if id not in self.__scheduled: # first beat (since going idle), start watching it
+                self.__scheduled[id] = now + self.death
+                heapq.heappush(self.__expiries, (now + self.death, id))
+
+    def idle(self, id: int) -> None:
+        """
+        Mark a process as idle, so it won't be considered dead until its next heartbeat.
 
-        proc["heartbeat"] = time.time()
+        Should be called before a process knowingly blocks for an unknown amount of time.
+        """
+        with self.__mod_lock:
+            if id in self.__processes:
+                self.__processes[id] = -1
 
-    def new_process(self, id: str) -> None:
+    def new_process(self, id: int) -> None:
         """
         Register a new process for the watchdog.
         """
         with self.__mod_lock:
-            self.__proccesses.append({"id": id, "heartbeat": -1})
+            self.__processes[id] = -1
 
-    def remove_process(self, id: str) -> None:
+    def remove_process(self, id: int) -> None:
         """
         Remove a process from the watchdog.
-        """
-        proc = [_ for _ in self.__proccesses if _["id"] == id][0]
 
+        Does nothing if the process is already gone (e.g. `watch` marked it as dead).
+        """
         with self.__mod_lock:
-            self.__proccesses.remove(proc)
+            self.__processes.pop(id, None)
+            self.__scheduled.pop(id, None) # its heap entry is dropped once `watch` reaches it
 
-    def is_alive(self, id: str) -> bool:
+    def is_alive(self, id: int) -> bool:
         """
         Check if a process is still 'alive'.
 
         A process is considered dead if its last heartbeat was more than `death`
         seconds ago.
         """
-        try:
-            proc = [_ for _ in self.__proccesses if _["id"] == id][0]
-        except IndexError: # no such process, is technically dead
-            return False
-
-        if proc["heartbeat"] == -1: # haven't started yet?
-            return True
+        heartbeat = self.__processes.get(id)
 
-        if time.time() - proc["heartbeat"] > self.death:
+        if heartbeat is None: # no such process, is technically dead
             return False
-        else:
+        if heartbeat == -1: # haven't started yet?
             return True
+        return time.time() - heartbeat <= self.death
 
     def watch(self) -> None:
         self.running = True
         while self.running:
-            for proc in self.__proccesses:
-                if not self.is_alive(proc["id"]):
-                    logger.info(f"WATCHDOG: Marked process of id: {proc["id"]} as dead!")
-                    self.remove_process(proc["id"])
-            time.sleep(0.05)
+            now = time.time()
+
+            with self.__mod_lock:
+                # only look at processes whose deadline has come. beats don't touch the heap,
+                # so a process that beat since is just pushed back to its new deadline.
+                while self.__expiries and self.__expiries[0][0] <= now:
+                    deadline, id = heapq.heappop(self.__expiries)
+                    if self.__scheduled.get(id) != deadline: # stale, the process was removed
+                        continue
+
+                    heartbeat = self.__processes.get(id)
+                    if heartbeat is None or heartbeat == -1: # removed already, or idle (its next beat re-queues it)
+                        del self.__scheduled[id]
+                        continue
+                    if heartbeat + self.death > now:
+                        self.__scheduled[id] = heartbeat + self.death
+                        heapq.heappush(self.__expiries, (heartbeat + self.death, id))
+                        continue
+
+                    del self.__scheduled[id]
+                    self.__processes.pop(id)
+                    logger.info(f"WATCHDOG: Marked process of id: {id} as dead!")
+
+                timeout = self.__expiries[0][0] - now if self.__expiries else 0.5
+
+            # sleep until the next deadline, but wake up now and then to notice we've been stopped
+            time.sleep(min(timeout, 0.5))
 
 class Radio:
     def __init__(self):
@@ -97,9 +133,11 @@ class Radio:
         """
         # Circular buffer for audio chunks
         self.buffer_lock = Lock()
+        self.load_lock = Lock()
         self.shutdown = False
         self.bitrate = 0
         self.watchdog = Watchdog()
+        self.consumer_ids = itertools.count() # cheap, unique ids for consumers
 
         with open("authkey.txt", "r") as f:
             self.key = f.read()
@@ -108,9 +146,11 @@ class Radio:
 
         self.playlist = []
         self.buffer = []
-        # Flag to control the producer thread
-        self.streaming_active = True
-        self.up_time = 0
+        self.flat_chunks: list[memoryview] = [] # every chunk of every track, in playback order
+        self.track_chunk_offsets: list[int] = [] # index into `flat_chunks` of each track's first chunk
+        self.total_chunks = 0
+        self.ws_clients: set[asyncio.Queue] = set() # one queue per connected `/ws` client
+        self.start_time: float | None = None # time.monotonic() at which the radio went live
 
     async def stop(self):
         """
@@ -120,41 +160,89 @@ class Radio:
         """
         self.shutdown = True
 
+        await self.notify_consumers()
+
+    async def notify_consumers(self):
+        """
+        Wake up all consumers waiting on new chunks (or shutdown).
+        """
         async with self.wake_consumers:
             self.wake_consumers.notify_all()
 
     async def add_track(self, title: str, author: str, path: str):
         """
         Add a track to the buffer.
+
+        The file is read in a worker thread, so consumers keep streaming while it loads.
         """
-        track = {"meta": {"title":title,"author":author,"path":path}, "data": []}
-        self.buffer.append(track)
+        meta = await asyncio.to_thread(self.load_track, asyncio.get_running_loop(), title, author, path)
 
-        track = self.buffer.index(track)
+        for queue in self.ws_clients:
+            queue.put_nowait(meta)
 
-        with open(path, "rb") as audio_file:
-            chunk = audio_file.read(50000)  # Read 50KB chunks
-            while chunk and self.streaming_active:
-                with self.buffer_lock:
-                    self.buffer[track]["data"].append(chunk)
-                chunk = audio_file.read(50000)
-                time.sleep(0.01)  # Simulate streaming rate
-        async with self.wake_consumers:
-            self.wake_consumers.notify_all()
+    def load_track(self, loop: asyncio.AbstractEventLoop, title: str, author: str, path: str) -> dict:
+        """
+        Read a track into the buffer, waking up consumers on `loop` once it's ready.
 
-    def get_chunk_from_time(self, bitrate_kbps: int) -> int:
+        Blocks until the whole file is read, use `add_track` from the event loop instead.
+
+        Returns the metadata of the new track.
         """
-        Fetch the chunk number based on the time (in seconds).
+        with self.load_lock: # one track at a time, or the chunks of two tracks could interleave
+            track = {"meta": {"title":title,"author":author,"path":path}, "data": []}
+            self.buffer.append(track)
+            self.track_chunk_offsets.append(len(self.flat_chunks))
+
+            with open(path, "rb") as audio_file:
+                # mapped instead of read: the pages live in the OS cache (shared, loaded on demand) instead of our heap.
+                # chunks are views into this, so it must stay alive. mmap refuses empty files.
+                if os.fstat(audio_file.fileno()).st_size:
+                    track["raw"] = mmap.mmap(audio_file.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    track["raw"] = b""
+
+            raw = memoryview(track["raw"])
+            chunks = [raw[i:i+50000] for i in range(0, len(raw), 50000)] # 50KB chunks
+
+            with self.buffer_lock:
+                track["data"].extend(chunks)
+                self.flat_chunks.extend(chunks)
+                self.total_chunks += len(chunks)
+            asyncio.run_coroutine_threadsafe(self.notify_consumers(), loop)
+
+            return track["meta"]
+
+    @property
+    def up_time(self) -> int:
+        """
+        Seconds since the radio went live (`start_time`), or 0 if it hasn't yet.
+        """
+        if self.start_time is None:
+            return 0
+        return int(time.monotonic() - self.start_time)
+
+    @property
+    def bitrate(self) -> int:
+        """
+        The bitrate of the radio's tracks, in kbps.
+
+        Setting this also updates `bytes_per_second`.
+        """
+        return self.__bitrate
 
-        `bitrate_kbps` should be in KB/s.
+    @bitrate.setter
+    def bitrate(self, bitrate_kbps: int) -> None:
+        self.__bitrate = bitrate_kbps
+        self.bytes_per_second = (bitrate_kbps * 1000) // 8  # kbps to Bps
 
-        Note that if `bitrate_kbps` is not correct, this will be inaccurate.
+    def get_chunk_from_time(self) -> int:
         """
-        # Convert bitrate to bytes per second
-        bytes_per_second = (bitrate_kbps * 1000) // 8  # kbps to Bps
+        Fetch the chunk number based on the time (in seconds).
 
+        Note that if `bitrate` is not correct, this will be inaccurate.
+        """
         # Calculate total bytes for the given time
-        total_bytes = self.up_time * bytes_per_second
+        total_bytes = self.up_time * self.bytes_per_second
 
         # Find the position in the list
         chunk_index = int(total_bytes // 50000)
@@ -164,99 +252,84 @@ class Radio:
         """
         Fetch track information from the chunk number.
         """
-        chunks = self.get_all_chunks()
-        chunk = chunks[chunk]
-
-        for track in self.buffer:
-            try:
-                if track["data"].index(chunk):
-                    return track["meta"]
-            except ValueError:
-                continue
-
-        return None
-
-    def get_all_chunks(self):
-        return list(itertools.chain(*[_["data"] for _ in self.buffer]))
-
-    def producer(self):
-        """
-        'Produces' radio playlist.
-
-        Loads all tracks in `playlist`, then begins incrementing `up_time` by one every second.
-        """
-        # for i, track in enumerate(self.playlist):
-        #     logger.info(f"BEGIN LOAD: {track["title"]}...")
-        #     self.buffer.append({"meta": track, "data": []})
-        #     try:
-        #         with open(track["path"], "rb") as audio_file:
-        #             chunk = audio_file.read(50000)  # Read 50KB chunks
-        #             while chunk and self.streaming_active:
-        #                 with self.buffer_lock:
-        #                     self.buffer[i]["data"].append(chunk)
-        #                 chunk = audio_file.read(50000)
-        #                 time.sleep(0.01)  # Simulate streaming rate
-        #     except FileNotFoundError:
-        #         print(f"File not found: {track}")
-        #     except Exception as e:
-        #         print(f"Error processing file {track}: {e}")
-
-        # Handle silence or looping if needed
-        watch_thread = Thread(target=self.watchdog.watch, daemon=True)
-        watch_thread.start()
-        while self.streaming_active:
-            self.up_time += 1
-            time.sleep(1)
+        if not 0 <= chunk < self.total_chunks:
+            return None
+
+        # the last track starting at or before `chunk` owns it, this also skips over empty tracks
+        track = bisect.bisect_right(self.track_chunk_offsets, chunk) - 1
+        return self.buffer[track]["meta"]
 
     async def consumer(self, request: Request):
         """
         'Consumes' radio playlist.
         
-        Generator that yields chunks from `producer`'s `buffer`.
+        Generator that yields chunks from `buffer`.
         To shutdown all consumers, call `stop`.
         """
         if self.shutdown:
             return
 
-        id = uuid.uuid4()
+        id = next(self.consumer_ids)
         self.watchdog.new_process(id)
         logger.info(f"Stream Connection ({id})! Current streams now at: {self.watchdog.active}")
 
-        start_index = self.get_chunk_from_time(self.bitrate)
-        current_index = start_index
+        reason = "Shutdown"
 
-        while not self.shutdown and self.watchdog.is_alive(id):
-            if await request.is_disconnected():
-                logger.info(f"Stream {id} going down! (Reason: Client Disconnect)")
-                self.watchdog.remove_process(id)
-                return
+        try:
+            start_index = self.get_chunk_from_time()
+            current_index = start_index
+
+            while not self.shutdown and self.watchdog.is_alive(id):
+                if await request.is_disconnected():
+                    reason = "Client Disconnect"
+                    break
 
-            self.watchdog.beat(id) # show that we're still alive.
+                self.watchdog.beat(id) # show that we're still alive.
 
-            # Stream the chunk if available
-            if current_index < len(self.get_all_chunks()):
-                chunk = self.get_all_chunks()[current_index]
-                logger.debug(f"({id}) YIELDING: {chunk[:2]}")
-                current_index += 1
-                yield chunk
+                # Stream the chunk if available
+                if current_index < self.total_chunks:
+                    chunk = self.flat_chunks[current_index]
+                    if logger.isEnabledFor(logging.DEBUG): # skip formatting (and slicing) entirely otherwise
+                        logger.debug("(%s) YIELDING: %r", id, bytes(chunk[:2]))
+                    current_index += 1
+                    yield chunk
 
-            # Wait for data or shutdown signal
-            async with self.wake_consumers:
-                while not self.shutdown and current_index >= len(self.get_all_chunks()):
-                    try:
-                        await asyncio.wait_for(self.wake_consumers.wait(), timeout=10)
-                    except asyncio.TimeoutError:
-                        print('timeout')
-                        break
+                # Wait for data or shutdown signal
+                if current_index >= self.total_chunks:
+                    self.watchdog.idle(id) # waiting on `add_track` doesn't mean we're dead
+                    async with self.wake_consumers:
+                        await self.wake_consumers.wait_for(lambda: self.shutdown or current_index < self.total_chunks)
 
                 if self.shutdown:
                     break
+        finally:
+            # always unregister, even if the stream was cancelled or errored out
+            self.watchdog.remove_process(id)
+            logger.info(f"Stream {id} going down! (Reason: {reason} / Remaining Streams: {self.watchdog.active})")
 
-        self.watchdog.remove_process(id)
-        logger.info(f"Stream {id} going down! (Reason: Shutdown / Remaining Streams: {self.watchdog.active})")
+radio = Radio()
 
+def handle_shutdown_signals(loop: asyncio.AbstractEventLoop):
+    """
+    Stop the radio as soon as SIGINT/SIGTERM arrives, then pass the signal on to
+    whoever handled it before (uvicorn).
 
-radio = Radio()
+    Stopping first wakes up every waiting consumer, so uvicorn's own graceful
+    shutdown isn't left waiting on streams that would never end.
+    """
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(sig)
+
+        def handler(signum, frame, previous=previous):
+            loop.call_soon_threadsafe(asyncio.ensure_future, radio.stop())
+
+            if callable(previous):
+                previous(signum, frame)
+            elif previous == signal.SIG_DFL: # nobody else cares, restore the default and let it happen
+                signal.signal(signum, previous)
+                signal.raise_signal(signum)
+
+        signal.signal(sig, handler)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -270,7 +343,6 @@ async def lifespan(app: FastAPI):
 
     for track in radio.playlist:
         logger.info(f"BEGIN LOAD: {track["title"]}...")
-        radio.buffer.append({"meta": track, "data": []})
         try:
             await radio.add_track(track["title"], track["author"], track["path"])
         except FileNotFoundError:
@@ -278,8 +350,12 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.error(f"Error processing file {track["path"]}: {e}")
 
-    producer_thread = Thread(target=radio.producer, daemon=True)
-    producer_thread.start()
+    watch_thread = Thread(target=radio.watchdog.watch, daemon=True)
+    watch_thread.start()
+
+    radio.start_time = time.monotonic()
+
+    handle_shutdown_signals(asyncio.get_running_loop())
 
     # chunk_time_thread = Thread(target=radio.get_chunk_time, daemon=True)
     # chunk_time_thread.start()
@@ -289,15 +365,12 @@ async def lifespan(app: FastAPI):
     finally:
         # shutdown
 
-        radio.shutdown = True
-        radio.streaming_active = False
         radio.watchdog.running = False
-        if not radio.shutdown:
-            radio.stop()
+        await radio.stop()
         with radio.buffer_lock:
             radio.buffer.clear()  # Clear the buffer to unblock any waiting consumers
-        logger.info("Waiting for producer to go down...")
-        producer_thread.join(80)
+        logger.info("Waiting for watchdog to go down...")
+        watch_thread.join(80)
 
 
 app = FastAPI(lifespan=lifespan)
@@ -345,28 +418,59 @@ async def add_to_playlist(title: str, author: str, path: str):
         return HTMLResponse(f"No such file '{path}'.")
 
 @app.get("/current")
-def get_current():
-    current_chunk = radio.get_chunk_from_time(radio.bitrate)
+async def get_current():
+    """
+    Currently playing track.
+
+    Only a bit of math and a bisect, so it's answered straight from the event loop
+    instead of FastAPI's threadpool.
+    """
+    current_chunk = radio.get_chunk_from_time()
     return {"meta": radio.get_track_from_chunk(current_chunk), "time": radio.up_time}
 
 @app.get("/shutdown")
 async def shutdown(key: str):
     if key == radio.key:
         logger.warning("Force shutdown request recieved! Aborting all streams!")
+        await radio.stop()
+
+        # streams are already down, so the API can now shut down without waiting on them
         logger.warning("Goodbye! (attempting to send SIGINT to API...)")
         os.kill(os.getpid(), signal.SIGINT)
-        await radio.stop()
         return HTMLResponse("Server shutdown acknowledged.", 200)
     else:
         return HTMLResponse("Request denied. Unauthorized.", 401)
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    """
+    Track feed.
+
+    Pushes the metadata of every newly added track to the client, as it's added.
+    """
     await websocket.accept()
-    while True:
-        await asyncio.sleep(0.1)
-        payload = next("audio")
-        await websocket.send_json(payload)
+
+    async def until_disconnect():
+        # the client never sends us anything we need, but this is how we hear it leave
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    queue = asyncio.Queue()
+    radio.ws_clients.add(queue)
+    disconnected = asyncio.create_task(until_disconnect())
+    try:
+        while True:
+            get = asyncio.create_task(queue.get())
+            await asyncio.wait((get, disconnected), return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done(): # gone, don't wait on the next track to find out
+                get.cancel()
+                break
+            await websocket.send_json(get.result())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        disconnected.cancel()
+        radio.ws_clients.discard(queue)
 
 
 if __name__ == "__main__":
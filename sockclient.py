@@ -1,14 +1,21 @@
 import subprocess
 import pyaudio
+import numpy as np
 import socket
 import threading
 import time
 import logging
 import signal
 import json
+import struct
 import sys
 import curses
 
+try:
+    import numba
+except ImportError: # numba is optional, volume scaling falls back to plain NumPy
+    numba = None
+
 logging.basicConfig(filename="radioclient.log",
                     format='%(asctime)s:%(name)s/%(levelname)s: %(message)s',
                     filemode='w', datefmt='%I:%M:%S %p')
@@ -20,10 +27,118 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logger.name = "RadioClient"
 
+if numba is not None:
+    # boundscheck off and the numpy error model keep bounds and zero-division checks out of the loop,
+    # so LLVM is free to vectorize it. nogil lets the UI thread run while a block is scaled.
+    @numba.njit(cache=True, fastmath=True, boundscheck=False, error_model="numpy", nogil=True)
+    def scale_pcm(samples: np.ndarray, vol_num: int, vol_den: int, out: np.ndarray) -> None:
+        """
+        Scale 16-bit PCM `samples` by `vol_num`/`vol_den`, writing the clipped result into `out`.
+
+        Compiled with Numba into a single native loop.
+        """
+        for i in range(samples.size):
+            v = samples[i] * vol_num // vol_den
+            out[i] = -32768 if v < -32768 else 32767 if v > 32767 else v
+else:
+    def scale_pcm(samples: np.ndarray, vol_num: int, vol_den: int, out: np.ndarray) -> None:
+        """
+        Scale 16-bit PCM `samples` by `vol_num`/`vol_den`, writing the clipped result into `out`.
+        """
+        scaled = samples.astype(np.int32) * vol_num // vol_den # int32 so it can't overflow before clipping
+        np.clip(scaled, -32768, 32767, out=out, casting="unsafe")
+
+class RingBuffer:
+    def __init__(self, size: int):
+        """
+        Single-producer, single-consumer byte ring buffer.
+
+        One thread may `fill` while another `read`s, without locking. Each side only
+        ever advances its own position, and waits on an Event when the other is behind.
+        """
+        self.size = size
+        self.closed = False
+
+        self.__view = memoryview(bytearray(size))
+        self.__read_pos = 0 # total bytes ever read
+        self.__write_pos = 0 # total bytes ever written
+
+        self.__readable = threading.Event()
+        self.__writable = threading.Event()
+
+    @property
+    def available(self) -> int:
+        """
+        The amount of bytes waiting to be read.
+        """
+        return self.__write_pos - self.__read_pos
+
+    def close(self) -> None:
+        """
+        Close the buffer, waking up both sides.
+
+        Pending `fill`s return 0, `read` returns whatever is left and then b"".
+        """
+        self.closed = True
+        self.__readable.set()
+        self.__writable.set()
+
+    def fill(self, readinto) -> int:
+        """
+        Read directly into the buffer's free space with `readinto`, blocking while it's full.
+
+        `readinto` gets a writable memoryview and returns the amount of bytes it read,
+        like `io.RawIOBase.readinto`. Returns that amount, or 0 if the buffer is closed.
+        """
+        while not self.closed:
+            self.__writable.clear() # clear before checking, so a `read` in between can't be missed
+            space = self.size - self.available
+            if space:
+                break
+            self.__writable.wait()
+        else:
+            return 0
+
+        start = self.__write_pos % self.size
+        n = readinto(self.__view[start:start+min(space, self.size - start)]) # up to where we wrap around
+
+        self.__write_pos += n
+        self.__readable.set()
+        return n
+
+    def read(self, n: int, align: int = 1) -> bytes:
+        """
+        Read up to `n` bytes, blocking until at least `align` bytes are available.
+
+        Only whole multiples of `align` are returned (e.g. full audio frames), so `n`
+        should be one too. Once closed, returns whatever is left, then b"".
+        """
+        while True:
+            self.__readable.clear() # clear before checking, so a `fill` in between can't be missed
+            if self.available >= align or self.closed:
+                break
+            self.__readable.wait()
+
+        n = min(n, self.available)
+        if n >= align:
+            n -= n % align
+        start = self.__read_pos % self.size
+        first = min(n, self.size - start) # bytes before we wrap around
+
+        data = bytes(self.__view[start:start+first])
+        if first < n:
+            data += self.__view[:n-first]
+
+        self.__read_pos += n
+        self.__writable.set()
+        return data
+
 class Client:
     def __init__(self):
-        self.running = True
+        self.stopped = threading.Event() # set once the client is shutting down, see `running`
         self.chunk_size = 90000
+        self.socket_buffer_size = 4 * 1024 * 1024 # kernel receive buffer for the stream
+        self.recv_buffer = memoryview(bytearray(self.chunk_size)) # every chunk is received into this, never a new bytes object
 
         self.volume = 100
 
@@ -31,21 +146,44 @@ class Client:
 
         self.last_ffmpeg_chunk = 0
         self.player_timeout = 10
+
+        self.pcm_frame_size = 4 # bytes per PCM frame, 2 channels of 16-bit samples
+        self.pcm_chunk_size = 16384 # max bytes of PCM played per iteration (4096 frames)
+        self.pcm_ring = RingBuffer(1 << 20) # PCM waiting to be played, filled by `pump_pcm`
+        self.pcm_out = np.empty(self.pcm_chunk_size // 2, dtype=np.int16) # reused volume-adjusted output
+        self.pcm_silence = bytes(self.pcm_chunk_size) # played while muted. PyAudio's write() only takes bytes, not memoryviews
+
+        # warm up scale_pcm so Numba (if present) compiles now instead of on the first chunk
+        scale_pcm(np.frombuffer(bytes(2), dtype="<i2"), 1, 1, self.pcm_out[:1])
         
         self.ffmpeg: subprocess.Popen = None
 
+    @property
+    def running(self) -> bool:
+        """
+        Whether the client should keep running. Setting this to False wakes up
+        anything waiting on `stopped` immediately.
+        """
+        return not self.stopped.is_set()
+
+    @running.setter
+    def running(self, value: bool) -> None:
+        if value:
+            self.stopped.clear()
+        else:
+            self.stopped.set()
+
     def heartbeat(self):
         """
         Heartbeat function to detect when FFMpeg is no longer sending data.
         """
 
-        while self.running:
+        while not self.stopped.wait(0.5): # returns True (and quits) as soon as we're stopped
             # print(time.time() - self.last_ffmpeg_chunk)
             if time.time() - self.last_ffmpeg_chunk > self.player_timeout: # 10 seconds since FFMpeg last gave us data, probably dead.
                 self.ffmpeg.terminate()
                 logger.debug("Watchdog killed player!")
                 break
-            time.sleep(0.1)
 
     def start_ffmpeg(self):
         """
@@ -76,11 +214,33 @@ class Client:
 
         self.ffmpeg = ffmpeg_process
 
+    def pump_pcm(self):
+        """
+        Move PCM from FFMpeg's `stdout` into `pcm_ring`, in large reads.
+
+        Reads go straight from the pipe into the ring, skipping `stdout`'s own buffer.
+        Closes `pcm_ring` once FFMpeg stops sending data.
+        """
+        pipe = self.ffmpeg.stdout.raw
+
+        while self.running:
+            try:
+                n = self.pcm_ring.fill(pipe.readinto)
+            except (OSError, ValueError): # stdout was closed under us, we're shutting down
+                break
+
+            if not n:
+                break
+
+            self.last_ffmpeg_chunk = time.time()
+
+        self.pcm_ring.close()
+
     def play_stream(self) -> int:
         """
         Create a PyAudio instance to play audio, blocking program execution until finished.
 
-        Automatically reads from the `ffmpeg` attribute and attempts to play it.
+        Automatically reads from the `ffmpeg` attribute (through `pcm_ring`) and attempts to play it.
 
         Will quit upon `running` being set to False if it isn't waiting on FFMpeg.
         """
@@ -89,43 +249,46 @@ class Client:
                         channels=2,
                         rate=44100,
                         output=True,
-                        frames_per_buffer=1024)
+                        frames_per_buffer=2048)
 
         self.last_ffmpeg_chunk = time.time() # dont get killed immediately
         heartbeat = threading.Thread(target=self.heartbeat, daemon=True)
         heartbeat.start()
+        pump = threading.Thread(target=self.pump_pcm, daemon=True)
+        pump.start()
 
         logger.info("Player online!")
 
         try:
             while self.running:
-                # Read the stream output from FFmpeg
-                pcm_data = self.ffmpeg.stdout.read(1024)
-                self.last_ffmpeg_chunk = time.time()
+                # Read the stream output from FFmpeg, whatever whole frames are ready (don't wait on a full chunk)
+                pcm_data = self.pcm_ring.read(self.pcm_chunk_size, self.pcm_frame_size)
                 # print(f"loading pcm data: {pcm_data[:10]}...")
 
-                adjusted_data = bytearray()
-
                 if pcm_data:
+                    volume = self.volume # read once, the UI thread may change it under us
+
+                    if volume == 100: # full volume, nothing to adjust
+                        stream.write(pcm_data)
+                        continue
+                    elif volume == 0: # muted, skip the math entirely
+                        n = len(pcm_data)
+                        stream.write(self.pcm_silence if n == self.pcm_chunk_size else self.pcm_silence[:n])
+                        continue
+
                     # adjust volume
-                    for i in range(0, len(pcm_data), 2):  # Process two bytes at a time (16-bit PCM)
-                        # Read two bytes (16-bit audio)
-                        sample = int.from_bytes(pcm_data[i:i+2], byteorder='little', signed=True)
-                        
-                        # Adjust the volume by scaling the sample
-                        adjusted_sample = int(sample * (self.volume/100))
-
-                        # Clip to valid 16-bit range and append to the adjusted audio
-                        adjusted_sample = max(min(adjusted_sample, 32767), -32768)
-                        adjusted_data.extend(adjusted_sample.to_bytes(2, byteorder='little', signed=True))
-
-                    stream.write(bytes(adjusted_data))
+                    samples = np.frombuffer(pcm_data, dtype="<i2")
+                    scale_pcm(samples, volume, 100, self.pcm_out[:len(samples)])
+
+                    stream.write(self.pcm_out[:len(samples)].tobytes())
                 else:
                     logger.info("FFMpeg stream down!")
                     self.running = False # player is dying, we should tell everything else to quit
                     break
         except KeyboardInterrupt:
             return 1
+        finally:
+            self.pcm_ring.close() # don't leave `pump_pcm` blocked on a full ring
 
         stream.stop_stream()
         stream.close()
@@ -141,24 +304,26 @@ class Client:
         host, port = self.host.split(":", maxsplit=1)
 
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # set before connect() so the TCP window is negotiated with it in mind
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.socket_buffer_size)
         sock.connect((host, int(port)))
 
         sock.send(b"CONN")
 
         logger.info("Server connection established!")
 
+        # no need to acknowledge chunks, TCP stops the server from getting ahead of us
         while True:
-            data = sock.recv(self.chunk_size)
-            logger.debug(f"RECIEVED {data[:10]}...")
+            try:
+                n = sock.recv_into(self.recv_buffer)
+                if logger.isEnabledFor(logging.DEBUG): # skip formatting (and slicing) entirely otherwise
+                    logger.debug("RECIEVED %r...", bytes(self.recv_buffer[:min(n, 10)]))
 
-            if not data:
-                logger.info("Server stream down!")
-                break
+                if not n:
+                    logger.info("Server stream down!")
+                    break
 
-            try:
-                self.ffmpeg.stdin.write(data)
-                logger.debug("SEND RECV")
-                sock.send(b"RECV") # ready for next chunk, send data back as a response
+                self.ffmpeg.stdin.write(self.recv_buffer[:n])
             except ConnectionResetError:
                 logger.warning("CONNECTION DIED!")
                 self.running = False
@@ -177,22 +342,86 @@ class Application:
 
         self.stdscr: curses.window = None
         self.h, self.w = 0,0
+        self.cy, self.cx = 0,0 # center of the screen, recomputed only on resize
+        self._last: dict[int, tuple[str, int]] = {} # row -> (text, attr) currently on screen
+
+        # text that never changes
+        self.join_instruct = "~ Enter Radio URL/Port ~"
+        self.status_title = "= Radio Status (Currently Playing) ="
+        self.status_instruct = "Connect? (Y/n)"
+        self.radio_title = "~ Connected to Radio ~"
+        self.radio_instruct = "Volume: +/-, Quit: q"
+
+        self.status: dict = None # latest radio status, swapped wholesale by `poll_status`
 
         self.fetch_thread = threading.Thread(target=self.client.fetch_audio, daemon=True)
         self.play_thread = threading.Thread(target=self.client.play_stream, daemon=True)
+        self.status_thread = threading.Thread(target=self.poll_status, daemon=True)
 
 
+    def clear(self):
+        """
+        Clear the screen and forget what was drawn on it.
+        """
+        self.stdscr.clear()
+        self._last.clear()
+
+    def update_size(self):
+        """
+        Re-read the terminal size, wiping the screen if it changed since everything has to be re-centered.
+
+        Only needs calling on startup and when getch() hands us a KEY_RESIZE.
+        """
+        size = self.stdscr.getmaxyx()
+        if size != (self.h, self.w):
+            self.h, self.w = size
+            self.cy, self.cx = self.h//2, self.w//2
+            self.clear()
+
+    def draw_centered(self, row: int, text: str, attr: int = 0) -> bool:
+        """
+        Draw `text` centered on `row`, replacing whatever was there.
+
+        Does nothing if the exact same text is already on that row. Returns whether anything was drawn.
+        """
+        if self._last.get(row) == (text, attr):
+            return False
+
+        self.stdscr.move(row, 0)
+        self.stdscr.clrtoeol()
+        self.stdscr.addstr(row, self.cx-(len(text)//2), text, attr)
+        self._last[row] = (text, attr)
+        return True
+
+    def recv_exactly(self, sock: socket.socket, n: int) -> bytearray:
+        """
+        Receive exactly `n` bytes from `sock`, however many `recv`s that takes.
+
+        Raises a ConnectionError if the server hangs up first.
+        """
+        data = bytearray(n)
+        view = memoryview(data)
+        received = 0
+
+        while received < n:
+            got = sock.recv_into(view[received:])
+            if not got:
+                raise ConnectionError(f"server closed the connection after {received} of {n} bytes.")
+            received += got
+        return data
+
     def get_status(self, url: str) -> dict:
         host, port = url.split(":", maxsplit=1)
         
         # display what we're joining
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.connect((host, int(port)))
 
             sock.send(b"STAT") # ask for the status
-            resp = sock.recv(4) # first 4 bytes will always either by NFND or the length of a successful response.
+            resp = self.recv_exactly(sock, 4) # first 4 bytes will always either by NFND or the length of a successful response.
         except Exception as e:
+            sock.close()
             # return False
             raise e
             print("Unable to establish a connection with the Radio server.")
@@ -200,14 +429,18 @@ class Application:
             print(f"error: {e}")
             sys.exit(1)
 
-        if resp == "NFND":
+        if resp == b"NFND":
+            sock.close()
             raise ConnectionError("Radio server experiencing issues.")
             print("The Radio server is experiencing errors and the connection should not proceed.")
             print("Contact the Radio owner about this issue, as they most likely have a misconfigured playlist.")
             sys.exit(1)
         else:
-            resp_length = int(resp)
-            resp = sock.recv(resp_length)
+            resp_length, = struct.unpack(">I", resp)
+            try:
+                resp = self.recv_exactly(sock, resp_length) # a big status can arrive over several segments
+            finally:
+                sock.close()
 
             status = json.loads(resp)
             return status
@@ -220,53 +453,51 @@ class Application:
             if not user.lower() == "y":
                 sys.exit()
 
+    def poll_status(self):
+        """
+        Refresh `status` from the server every 5 seconds until the client stops.
+
+        Runs on its own thread so the UI never waits on the network.
+        """
+        while not self.client.stopped.wait(5):
+            try:
+                self.status = self.get_status(self.client.host)
+            except Exception as e: # keep showing the last status, the next poll might work
+                logger.warning(f"unable to refresh the radio status: {e}")
+
     def start_radio(self, host: str):
+        self.status = self.get_status(host)
+
         self.client.start_ffmpeg()
         self.fetch_thread.start()
         self.play_thread.start()
+        self.status_thread.start()
 
-        start = 0
+        shown_status = None
+        shown_volume = None
 
         try:
             while client.running:
                 k = self.stdscr.getch()
-                self.h, self.w = self.stdscr.getmaxyx()
+                if k == curses.KEY_RESIZE:
+                    self.update_size()
 
-                if time.time() - start > 5:
-                    start = time.time()
-                    status = self.get_status(host)
-                    self.stdscr.clear()
+                status = self.status
+                if status is not shown_status:
+                    shown_status = status
+                    uptime = f"Radio Time: {status["radio_time"]}"
+                    track = f"{status["current"]["author"]} - {status["current"]["title"]}"
 
-                title = f"~ Connected to Radio ~"
-                uptime = f"Radio Time: {status["radio_time"]}"
-                track = f"{status["current"]["author"]} - {status["current"]["title"]}"
-                volume = f"{self.client.volume}%"
-                instruct = "Volume: +/-, Quit: q"
-
-                self.stdscr.move((self.h//2)-3, 0)
-                self.stdscr.clrtoeol()
-                self.stdscr.addstr((self.h//2)-3, (self.w//2)-(len(title)//2), title)
-                self.stdscr.clrtoeol()
-
-                self.stdscr.move((self.h//2)-2, 0)
-                self.stdscr.clrtoeol()
-                self.stdscr.addstr((self.h//2)-2, (self.w//2)-(len(uptime)//2), uptime)
-                self.stdscr.clrtoeol()
-                
-                self.stdscr.move((self.h//2)-1, 0)
-                self.stdscr.clrtoeol()
-                self.stdscr.addstr((self.h//2)-1, (self.w//2)-(len(track)//2), track)
-                self.stdscr.clrtoeol()
-
-                self.stdscr.move((self.h//2), 0)
-                self.stdscr.clrtoeol()
-                self.stdscr.addstr((self.h//2), (self.w//2)-(len(volume)//2), volume)
-                self.stdscr.clrtoeol()
-
-                self.stdscr.move((self.h//2)+1, 0)
-                self.stdscr.clrtoeol()
-                self.stdscr.addstr((self.h//2)+1, (self.w//2)-(len(instruct)//2), instruct)
-                self.stdscr.clrtoeol()
+                if self.client.volume != shown_volume:
+                    shown_volume = self.client.volume
+                    volume = f"{shown_volume}%"
+
+                # only lines whose text changed are touched, getch() refreshes for us
+                self.draw_centered(self.cy-3, self.radio_title)
+                self.draw_centered(self.cy-2, uptime)
+                self.draw_centered(self.cy-1, track)
+                self.draw_centered(self.cy, volume)
+                self.draw_centered(self.cy+1, self.radio_instruct)
 
 
                 if k == -1:
@@ -283,7 +514,7 @@ class Application:
                 elif self.client.volume <= 0:
                     self.client.volume = 0
 
-                time.sleep(0.005)
+                time.sleep(0.05)
         except:
             pass
 
@@ -301,7 +532,7 @@ class Application:
 
         self.fetch_thread.join()
         self.play_thread.join()
-        self.stdscr.clear()
+        self.clear()
 
     def main(self, stdscr: curses.window):
         curses.start_color()
@@ -322,13 +553,14 @@ class Application:
         self.stdscr.keypad(True)
         user_input = ""
 
-        self.h, self.w = self.stdscr.getmaxyx()
+        self.update_size()
 
         while True:
             k = self.stdscr.getch()
-            self.h, self.w = self.stdscr.getmaxyx()
+            if k == curses.KEY_RESIZE:
+                self.update_size()
 
-            instruct = "~ Enter Radio URL/Port ~"
+            instruct = self.join_instruct
 
 
             if k == -1:
@@ -339,36 +571,37 @@ class Application:
                 user_input = user_input[:len(user_input)-1]
             elif k in [curses.KEY_ENTER, 10, 13] and user_input:
                 instruct = f"Attempting to connect to '{user_input}'..."
-                self.stdscr.addstr((self.h//2)-2, (self.w//2)-(len(instruct)//2), instruct)
+                self.draw_centered(self.cy-2, instruct)
                 self.stdscr.refresh()
                 time.sleep(0.5)
                 status = self.get_status(user_input)
 
-                self.stdscr.clear()
+                self.clear()
 
-                while True:
-                    title = "= Radio Status (Currently Playing) ="
-                    uptime = f"Uptime: {status["uptime"]} sec / {status["radio_time"]}"
-                    track = f"{status["current"]["author"]} - {status["current"]["title"]}"
-                    instruct = "Connect? (Y/n)"
+                uptime = f"Uptime: {status["uptime"]} sec / {status["radio_time"]}"
+                track = f"{status["current"]["author"]} - {status["current"]["title"]}"
 
-                    self.stdscr.addstr((self.h//2)-3, (self.w//2)-(len(title)//2), title)
-                    self.stdscr.addstr((self.h//2)-2, (self.w//2)-(len(uptime)//2), uptime)
-                    self.stdscr.addstr((self.h//2)-1, (self.w//2)-(len(track)//2), track)
-                    self.stdscr.addstr((self.h//2)+1, (self.w//2)-(len(instruct)//2), instruct)
-                    self.stdscr.refresh()
+                while True:
+                    dirty = self.draw_centered(self.cy-3, self.status_title)
+                    dirty |= self.draw_centered(self.cy-2, uptime)
+                    dirty |= self.draw_centered(self.cy-1, track)
+                    dirty |= self.draw_centered(self.cy+1, self.status_instruct)
+                    if dirty:
+                        self.stdscr.refresh()
 
                     k = self.stdscr.getch()
 
                     if k == -1:
-                        continue
+                        pass
+                    elif k == curses.KEY_RESIZE:
+                        self.update_size()
                     elif chr(k).lower() == "y":
-                        self.stdscr.clear()
+                        self.clear()
                         self.client.host = user_input
                         self.start_radio(user_input)
                         break
                     elif chr(k).lower() == "n":
-                        self.stdscr.clear()
+                        self.clear()
                         break
 
                     time.sleep(0.05)
@@ -377,22 +610,16 @@ class Application:
 
             user_input_str = user_input+f" "*(14-len(user_input))
 
-            self.stdscr.move((self.h//2)-2, 0)
-            self.stdscr.clrtoeol()
-            self.stdscr.addstr((self.h//2)-2, (self.w//2)-(len(instruct)//2), instruct)
-            self.stdscr.clrtoeol()
-
-            self.stdscr.move((self.h//2)-1, 0)
-            self.stdscr.clrtoeol()
+            dirty = self.draw_centered(self.cy-2, instruct)
             if user_input:
-                self.stdscr.addstr((self.h//2)-1, (self.w//2)-(len(user_input_str)//2), user_input_str, color_black_white)
+                dirty |= self.draw_centered(self.cy-1, user_input_str, color_black_white)
             else:
                 placeholder = "127.0.0.1:8000"
-                self.stdscr.addstr((self.h//2)-1, (self.w//2)-(len(placeholder)//2), placeholder, color_yellow_white)
-            self.stdscr.clrtoeol()
+                dirty |= self.draw_centered(self.cy-1, placeholder, color_yellow_white)
 
-            self.stdscr.refresh()
-            time.sleep(0.005)
+            if dirty:
+                self.stdscr.refresh()
+            time.sleep(0.05)
 
 
 client = Client()
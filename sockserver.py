@@ -1,10 +1,17 @@
 import socket
+import asyncio
 import time
-import threading
 import logging
-import uuid
+import itertools
+import heapq
 import os, sys
 import json
+import struct
+import bisect
+import mmap
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 
 logging.basicConfig(#filename="radio.log",
                     format='%(asctime)s:%(name)s/%(levelname)s: %(message)s',
@@ -13,10 +20,24 @@ logging.basicConfig(#filename="radio.log",
 # Creating an object
 logger = logging.getLogger()
 
-# Setting the threshold of logger to DEBUG
-logger.setLevel(logging.DEBUG)
+# Setting the threshold of logger to INFO, DEBUG (every send, every consumer) is opt-in with RADIO_DEBUG=1
+logger.setLevel(logging.DEBUG if os.environ.get("RADIO_DEBUG") else logging.INFO)
 logger.name = "RadioServer"
 
+# MPEG-1 Layer III header lookup tables, 0 marks an invalid index
+MP3_BITRATES = np.array([0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0], dtype=np.int64) # kbps
+MP3_SAMPLE_RATES = np.array([44100, 48000, 32000, 0], dtype=np.int64) # Hz
+
+# the third header byte holds the bitrate, sample rate and padding bit, so a frame's size and duration
+# follow from it alone. worked out once here for all 256 values, 0 size marks an invalid header.
+_header = np.arange(256)
+_bitrates = MP3_BITRATES[_header >> 4]
+_sample_rates = MP3_SAMPLE_RATES[(_header >> 2) & 0x03]
+_valid = (_bitrates != 0) & (_sample_rates != 0)
+MP3_FRAME_SIZES = np.where(_valid, 144 * _bitrates * 1000 // np.where(_valid, _sample_rates, 1) + ((_header >> 1) & 0x01), 0) # bytes
+MP3_FRAME_DURATIONS = np.where(_valid, 1152 / np.where(_valid, _sample_rates, 1), 0.0) # seconds
+del _header, _bitrates, _sample_rates, _valid
+
 class Watchdog:
     def __init__(self):
         """
@@ -27,69 +48,83 @@ class Watchdog:
         self.death = 100
         self.running = False
 
-        self.__proccesses = []
-        self.__mod_lock = threading.Lock()
+        # id -> last heartbeat, -1 if it hasn't beat yet.
+        # only ever touched from the event loop, so it needs no lock.
+        self.__processes: dict[int, float] = {}
+        # (earliest time it could be dead, id), at most one per beating process. see `watch`
+        self.__expiries: list[tuple[float, int]] = []
 
     @property
     def active(self):
         """
         The amount of processes the Watchdog is aware of.
         """
-        return len(self.__proccesses)
+        return len(self.__processes)
 
-    def beat(self, id: str) -> None:
+    def beat(self, id: int) -> None:
         """
         Process heartbeat. Should be called every iteration to prove the thread is
         still alive.
         """
+        previous = self.__processes.get(id)
+        if previous is None: # don't resurrect a process the watchdog already removed
+            return
 
-        proc = [_ for _ in self.__proccesses if _["id"] == id][0]
-
-        proc["heartbeat"] = time.time()
+        now = time.time()
+        self.__processes[id] = now
+        if previous == -1: # first beat, start watching it
+            heapq.heappush(self.__expiries, (now + self.death, id))
 
-    def new_process(self, id: str) -> None:
+    def new_process(self, id: int) -> None:
         """
         Register a new process for the watchdog.
         """
-        with self.__mod_lock:
-            self.__proccesses.append({"id": id, "heartbeat": -1})
+        self.__processes[id] = -1
 
-    def remove_process(self, id: str) -> None:
+    def remove_process(self, id: int) -> None:
         """
-        Remove a process from the watchdog.
+        Remove a process from the watchdog. Does nothing if it was already removed.
         """
-        proc = [_ for _ in self.__proccesses if _["id"] == id][0]
-
-        with self.__mod_lock:
-            self.__proccesses.remove(proc)
+        self.__processes.pop(id, None)
 
-    def is_alive(self, id: str) -> bool:
+    def is_alive(self, id: int) -> bool:
         """
         Check if a process is still 'alive'.
 
         A process is considered dead if its last heartbeat was more than `death`
         seconds ago.
         """
-        try:
-            proc = [_ for _ in self.__proccesses if _["id"] == id][0]
-        except IndexError: # no such process, is technically dead
-            return False
+        heartbeat = self.__processes.get(id)
 
-        if proc["heartbeat"] == -1: # haven't started yet?
-            return True
-        if time.time() - proc["heartbeat"] > self.death:
+        if heartbeat is None: # no such process, is technically dead
             return False
-        else:
+        if heartbeat == -1: # haven't started yet?
             return True
+        return time.time() - heartbeat <= self.death
 
-    def watch(self) -> None:
+    async def watch(self) -> None:
         self.running = True
         while self.running:
-            for proc in self.__proccesses:
-                if not self.is_alive(proc["id"]):
-                    logger.info(f"WATCHDOG: Marked process of id: {proc["id"]} as dead!")
-                    self.remove_process(proc["id"])
-            time.sleep(0.05)
+            now = time.time()
+
+            # only look at processes whose deadline has come. beats don't touch the heap,
+            # so a process that beat since is just pushed back to its new deadline.
+            while self.__expiries and self.__expiries[0][0] <= now:
+                _, id = heapq.heappop(self.__expiries)
+                heartbeat = self.__processes.get(id)
+
+                if heartbeat is None: # removed already
+                    continue
+                if heartbeat + self.death > now:
+                    heapq.heappush(self.__expiries, (heartbeat + self.death, id))
+                    continue
+
+                self.__processes.pop(id)
+                logger.info(f"WATCHDOG: Marked process of id: {id} as dead!")
+
+            # sleep until the next deadline, but wake up now and then to notice we've been stopped
+            timeout = self.__expiries[0][0] - now if self.__expiries else 0.5
+            await asyncio.sleep(min(timeout, 0.5))
 
 
 class Radio:
@@ -99,78 +134,54 @@ class Radio:
         self.running = False
 
         self.chunk_size = 90000
+        self.send_window = 4 # most chunks sent by a single sendfile call
+        self.socket_buffer_size = 4 * 1024 * 1024 # kernel send buffer per client, room for plenty of chunks
+        self.reuse_port = False # let several server processes share one port (see README)
 
         self.api_auth_key = api_auth_key
 
-        self.buffer = []
+        # the buffer is every track's bytes back to back, but only ever read from the track files themselves.
+        # chunk i covers bytes offsets[i] up to offsets[i+1] of it
+        self.stream_size = 0 # bytes
+        self.offsets = np.zeros(1, dtype=np.int64)
+        # one entry per track in the buffer: its file, where it starts and its first chunk. consumers send straight from the files
+        self.track_paths: list[str] = []
+        self.track_starts = np.zeros(0, dtype=np.int64)
+        self.track_chunks = np.zeros(0, dtype=np.int64)
+        # one entry per MP3 frame in the buffer: where it starts, how long it is, and the radio time it finishes at
+        self.frame_offsets = np.zeros(0, dtype=np.int64)
+        self.frame_sizes = np.zeros(0, dtype=np.int32)
+        self.frame_ends = np.zeros(0, dtype=np.float64)
+        self.buffer_duration = 0.0 # total length of the buffer, in seconds. kept up to date by `commit_track`
         self.playlist = []
+        self.playlist_ends: list[float] = [] # radio time each playlist track ends at
+        self.playlist_json: list[bytes] = [] # each playlist track, already serialized for `status`
 
-        self.up_time = 0 # total uptime, in seconds
-        self.radio_time = 0 # radio time, in seconds. used for new consumers to join roughly at the same position as others
+        self.start_time: float = None # time.monotonic() when the radio went live
+        self.loop_start: float = None # time.monotonic() when the buffer (last) started playing from 0, see `radio_time`
 
         self.watchdog = Watchdog()
-        self.watch_thread = threading.Thread(target=self.watchdog.watch, daemon=True)
-        self.producer_thread = threading.Thread(target=self.producer, daemon=True)
+        self.consumer_ids = itertools.count()
 
-    def __parse_mp3_header(self, header: bytes):
+    @property
+    def up_time(self) -> int:
         """
-        Parse an MP3 frame header from a chunk and return bitrate, sample_rate, and frame_size.
-
-        Will not reject non-MP3 bytes, be careful what you input!
+        Seconds since the radio went live (`start_time`), or 0 if it hasn't yet.
         """
-        bitrates = [
-            None, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, None
-        ]
-        sample_rates = [44100, 48000, 32000, None]
-
-        # Ensure header starts with 0xFF
-        if (header[0] != 0xFF) or ((header[1] & 0xE0) != 0xE0):
-            return None  # Not a valid MP3 frame header
+        if self.start_time is None:
+            return 0
+        return int(time.monotonic() - self.start_time)
 
-        # Parse fields
-        bitrate_index = (header[2] >> 4) & 0x0F
-        sample_rate_index = (header[2] >> 2) & 0x03
-        padding_bit = (header[2] >> 1) & 0x01
-
-        bitrate = bitrates[bitrate_index]
-        sample_rate = sample_rates[sample_rate_index]
-
-        if bitrate is None or sample_rate is None:
-            return None
-
-        # Calculate frame size
-        frame_size = int((144 * bitrate * 1000) / sample_rate + padding_bit)
-        duration = 1152 / sample_rate  # Frame duration in seconds for MP3
-
-        return bitrate, sample_rate, frame_size, duration
-
-    def calculate_buffer_duration(self) -> float:
-        """
-        Calculate the total duration of MP3 data in the buffer.
-        
-        Currently only supports MP3!
+    @property
+    def radio_time(self) -> float:
         """
-        total_duration = 0.0
-        leftover = b''
-
-        for chunk in self.buffer:
-            data = leftover + chunk  # Append leftover data from the previous chunk
-            position = 0
-
-            while position + 4 <= len(data):  # Ensure enough bytes for a header
-                header = data[position:position + 4]
-                parsed = self.__parse_mp3_header(header)
-
-                if parsed:
-                    bitrate, sample_rate, frame_size, duration = parsed
-                    total_duration += duration
-                    position += frame_size  # Move to the next frame
-                else:
-                    position += 1  # Shift by one byte and retry
-
-            leftover = data[position:]  # Save any leftover data for the next chunk
+        How far into the buffer the radio currently is, in seconds. Loops back to 0 once it runs out.
 
-        return total_duration
+        Used for new consumers to join roughly at the same position as others.
+        """
+        if self.loop_start is None or not self.buffer_duration:
+            return 0.0
+        return (time.monotonic() - self.loop_start) % self.buffer_duration
 
     def find_chunk_by_time(self, target_time: int):
         """
@@ -178,135 +189,253 @@ class Radio:
 
         Currently only supports MP3!
         """
-        total_duration = 0.0
-        leftover = b''
-
-        for i, chunk in enumerate(self.buffer):
-            data = leftover + chunk  # Append leftover data from the previous chunk
-            position = 0
-
-            while position + 4 <= len(data):  # Ensure enough bytes for a header
-                header = data[position:position + 4]
-                parsed = self.__parse_mp3_header(header)
+        # the first frame still playing at `target_time`
+        frame = int(np.searchsorted(self.frame_ends, target_time))
+        if frame >= len(self.frame_ends):
+            raise ValueError("Target time exceeds total buffer duration.")
 
-                if parsed:
-                    bitrate, sample_rate, frame_size, duration = parsed
-                    total_duration += duration
+        # Return the chunk holding that frame and its position within the chunk
+        position = int(self.frame_offsets[frame])
+        i = int(np.searchsorted(self.offsets, position, side="right")) - 1
+        return i, position - int(self.offsets[i])
 
-                    if total_duration >= target_time:
-                        # Return the current chunk index and position within the chunk
-                        return i, position
-
-                    position += frame_size  # Move to the next frame
-                else:
-                    position += 1  # Shift by one byte and retry
-
-            leftover = data[position:]  # Save any leftover data for the next chunk
+    def index_frames(self, data: bytes | mmap.mmap) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Walk the MP3 frames in `data`, returning the offset, size and duration of each one.
 
-        raise ValueError("Target time exceeds total buffer duration.")
+        Will not reject non-MP3 bytes, be careful what you input!
+        Currently only supports MP3!
+        """
+        b = np.frombuffer(data, dtype=np.uint8)
+        if len(b) < 4: # not even room for a header
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float64)
+
+        # every position that starts with a frame sync (0xFF, then the top 3 bits of the next byte set).
+        # only a small share of bytes are 0xFF, so find those first and check the next byte of just them.
+        positions = np.flatnonzero(b[:-3] == 0xFF)
+        positions = positions[(b[positions + 1] & 0xE0) == 0xE0]
+
+        # parse all of their headers at once
+        header = b[positions + 2]
+        frame_sizes = MP3_FRAME_SIZES[header]
+        valid = frame_sizes != 0
+
+        positions, header, frame_sizes = positions[valid], header[valid], frame_sizes[valid]
+        durations = MP3_FRAME_DURATIONS[header]
+
+        # a sync can also turn up inside a frame's data, so follow the chain from the first header:
+        # each frame is followed by the first header at or after its end.
+        following = np.searchsorted(positions, positions + frame_sizes).tolist()
+        frames = []
+        k = 0
+        while k < len(following):
+            frames.append(k)
+            k = following[k]
+
+        return positions[frames], frame_sizes[frames].astype(np.int32), durations[frames]
+
+    def load_track(self, track: str) -> tuple[int, tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Read and index a track, returning its size and frames, without adding it to the buffer yet.
 
-    def add_track(self, track: str):
+        Safe to run off the event loop, pass the result to `commit_track` from it.
+        """
         with open(track, "rb") as f:
-            to_add = []
-            while True:
-                chunk = f.read(radio.chunk_size)
-
-                if chunk:
-                    # print(chunk[:10])
-                    to_add.append(chunk)
-                else:
-                    break
-            radio.buffer.extend(to_add)
+            size = os.fstat(f.fileno()).st_size
+            if not size: # an empty file can't be mapped
+                return 0, self.index_frames(b"")
+            # parse the file in place, paged in as the parser reaches it. the bytes stay on disk until a consumer sends them
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return size, self.index_frames(data)
+
+    def commit_track(self, track: str, size: int, frames: tuple[np.ndarray, np.ndarray, np.ndarray]):
+        """
+        Append `track`, as returned by `load_track`, to the buffer.
 
-    def status(self, client: socket.socket):
-        current_time = radio.radio_time
-        
-        track_time = 0
-        for track in self.playlist:
-            track_time += track["length"]
-            if current_time <= track_time:
-                # track = json.dumps(track)
-                final = json.dumps({"radio_time": self.radio_time, "uptime": self.up_time, "current": track})
-                client.send(f"{len(final):04d}{final}".encode())
-                client.close()
-                return
-        client.send(b"NFND")
-        client.close()
+        Consumers read the buffer between awaits, so this must run on the event loop (or before it starts).
+        """
+        if not size: # nothing to play
+            return
 
+        frame_offsets, frame_sizes, frame_durations = frames
+        position = self.radio_time # a longer buffer mustn't move where we are in it
+        start = self.stream_size
+        end = start + size
+
+        # chunks start on frame boundaries, the first one at or after every `chunk_size` bytes.
+        # they never straddle two tracks, and the first also carries whatever comes before the first frame (tags).
+        targets = np.arange(self.chunk_size, size, self.chunk_size, dtype=np.int64)
+        first_frames = np.searchsorted(frame_offsets, targets)
+        first_frames = first_frames[first_frames < len(frame_offsets)] # past the last frame, the last chunk just runs long
+        chunk_starts = np.unique(np.concatenate(([0], frame_offsets[first_frames])))
+
+        self.stream_size = end
+        self.track_paths.append(track)
+        self.track_starts = np.append(self.track_starts, start)
+        self.track_chunks = np.append(self.track_chunks, len(self.offsets) - 1)
+        self.offsets = np.concatenate((self.offsets[:-1], start + chunk_starts, [end]))
+
+        self.frame_offsets = np.concatenate((self.frame_offsets, start + frame_offsets))
+        self.frame_sizes = np.concatenate((self.frame_sizes, frame_sizes))
+        elapsed = self.frame_ends[-1] if len(self.frame_ends) else 0.0
+        self.frame_ends = np.concatenate((self.frame_ends, elapsed + np.cumsum(frame_durations)))
+        if len(self.frame_ends):
+            self.buffer_duration = float(self.frame_ends[-1])
+        if self.loop_start is not None:
+            self.loop_start = time.monotonic() - position
 
-    def producer(self):
-        logger.info("finding length of buffer...")
-        buffer_length = self.calculate_buffer_duration()
-        logger.info(f"calculated buffer length of {buffer_length} seconds.")
+    def add_track(self, track: str):
+        self.commit_track(track, *self.load_track(track))
 
-        while self.running:
-            self.up_time += 1
+    def add_to_playlist(self, track: dict):
+        """
+        Add a track's details to the playlist, for `status` to report while it plays.
+        """
+        previous_end = self.playlist_ends[-1] if self.playlist_ends else 0
+        self.playlist_ends.append(previous_end + float(track["length"]))
+        self.playlist_json.append(json.dumps(track).encode())
+        self.playlist.append(track)
+
+    def status(self, client: asyncio.StreamWriter):
+        current_time = self.radio_time
+
+        # the first track that hasn't ended yet
+        current = bisect.bisect_left(self.playlist_ends, current_time)
+        if current >= len(self.playlist):
+            client.write(b"NFND")
+            client.close()
+            return
 
-            if not self.radio_time + 1 > buffer_length:
-                self.radio_time += 1
-            else:
-                self.radio_time = 0 # reset radio time to loop data once we run out
+        final = b'{"radio_time": %d, "uptime": %d, "current": %s}' % (current_time, self.up_time, self.playlist_json[current])
+        client.writelines((struct.pack(">I", len(final)), final)) # header and body go out together (sendmsg) without being joined first
+        client.close() # flushes whatever is still buffered first
 
-            time.sleep(1)
 
-    def consumer(self, client: socket.socket):
+    async def consumer(self, client: asyncio.StreamWriter):
         i = 0
-        id = uuid.uuid4()
+        id = next(self.consumer_ids)
+        loop = asyncio.get_running_loop()
+        debug = logger.isEnabledFor(logging.DEBUG) # checked once, not per send
+        files = {} # track index -> our own handle on it. sendfile moves the file position, so they can't be shared
 
         self.watchdog.new_process(id)
 
-        join_chunk, offset = self.find_chunk_by_time(self.radio_time)
+        join_time = self.radio_time
+        join_chunk, offset = self.find_chunk_by_time(join_time)
 
-        logger.info(f"new consumer of id: '{id}' established. joining at chunk {join_chunk} ({self.radio_time} sec).")
+        logger.info(f"new consumer of id: '{id}' established. joining at chunk {join_chunk} ({join_time:.1f} sec).")
 
         i = join_chunk
 
-        while self.running and self.watchdog.is_alive(id):
-            # if i >= len(self.buffer):
-            #     logger.debug("closing connection!")
-            #     client.send(b"")
-            #     client.close()
-            #     i = 0
-            #     break
-            try:
-                if i >= len(self.buffer):
-                    i = 0
-                    logger.debug(f"({id}) repeat!")
-
-                logger.debug(f"({id}) sending data: {self.buffer[i][:3]}...")
-                client.send(self.buffer[i])
-                self.watchdog.beat(id)
-                i += 1
-
-                logger.debug(f"({id}) waiting on confirmation...")
-                resp = client.recv(4)
-                logger.debug(f"({id}) confirmation recieved. ({resp})")
-                
-                if b"RECV" not in resp:
-                    logger.warning(f"({id}) non RECV packet! ({resp})")
-                    client.close()
+        try:
+            while self.running and self.watchdog.is_alive(id):
+                try:
+                    offsets = self.offsets
+                    if i >= len(offsets) - 1:
+                        i = 0
+                        if debug:
+                            logger.debug("(%s) repeat!", id)
+
+                    # chunks of the same track sit back to back in its file, send up to `send_window` of them in one go
+                    track = int(np.searchsorted(self.track_chunks, i, side="right")) - 1
+                    last = int(self.track_chunks[track + 1]) if track + 1 < len(self.track_chunks) else len(offsets) - 1
+                    end = min(i + self.send_window, last)
+
+                    if track not in files:
+                        files[track] = open(self.track_paths[track], "rb")
+                    start = int(offsets[i] - self.track_starts[track])
+                    count = int(offsets[end] - offsets[i])
+
+                    if debug:
+                        logger.debug("(%s) sending chunks %s-%s (%s bytes of '%s')...", id, i, end, count, self.track_paths[track])
+                    # sendfile(2) where possible, so the audio goes from the page cache to the socket without passing through us.
+                    # yields while the client's receive window is full, which paces us to its playback.
+                    # without acknowledgements, a client that stops reading would leave us here forever,
+                    # so give up once it's been stuck for as long as the watchdog would tolerate.
+                    async with asyncio.timeout(self.watchdog.death):
+                        await loop.sendfile(client.transport, files[track], start, count)
+                    self.watchdog.beat(id)
+                    i = end
+                except (ConnectionError, RuntimeError): # RuntimeError: the transport was already closing
+                    logger.info(f"connection with consumer of id: '{id}' was reset. exiting.")
+                    break
+                except TimeoutError:
+                    logger.info(f"consumer of id: '{id}' stopped reading for {self.watchdog.death} sec. exiting.")
                     break
+        finally:
+            for file in files.values():
+                file.close()
 
-                time.sleep(0.001)
-            except ConnectionResetError:
-                logger.info(f"connection with consumer of id: '{id}' was reset. exiting.")
-                break
+        self.watchdog.remove_process(id) # may already be gone if the watchdog killed us
+        client.close()
+        logger.info(f"consumer of id: '{id}' exiting gracefully!")
+
+    async def handle(self, reader: asyncio.StreamReader, client: asyncio.StreamWriter):
+        """
+        Serve a single connection, dispatching on the request it opens with.
+        """
+        # asyncio already sets TCP_NODELAY on every connection
         try:
-            self.watchdog.remove_process(id)
-        except IndexError: # process is already dead, probably killed by watchdog
+            async with asyncio.timeout(5):
+                client_data = await reader.read(20000)
+        except (TimeoutError, ConnectionResetError):
             client.close()
-        logger.info(f"consumer of id: '{id}' exiting gracefully!")
+            return
+
+        request = client_data[:4] # every request opens with a 4 byte name
+        if request == b"CONN": # consumer request
+            try:
+                await self.consumer(client)
+            except asyncio.CancelledError: # server is shutting down, nothing is waiting on us so just hang up
+                client.close()
+        elif request == b"STAT": # status / "now playing"
+            self.status(client)
+        elif request == b"TADD": # track addition request
+            client_data = client_data.split(b" ")
+            # TADD <AUTHKEY> <TRACK>
+            try:
+                authkey = client_data[1]
+                track = client_data[2]
+            except IndexError:
+                client.write(b"INVL")
+                client.close()
+                return
+
+            if authkey.decode() == self.api_auth_key:
+                if not os.path.exists(track.decode()):
+                    client.write(b"NFND")
+                    client.close()
+                    return
 
-    def main(self):
+                loaded = await asyncio.to_thread(self.load_track, track.decode()) # reading and indexing is slow
+                self.commit_track(track.decode(), *loaded)
+                client.write(b"TADD")
+                client.close()
+
+            else:
+                client.write(b"AUTH")
+                client.close()
+        else:
+            logger.warning(f"bad connection: {client_data[:20]}!")
+            client.close()
+
+    async def main(self):
         self.running = True
         connect = False
 
-        self.watch_thread.start()
-        self.producer_thread.start()
+        logger.info(f"buffer length is {self.buffer_duration} seconds.")
+        self.start_time = self.loop_start = time.monotonic() # on air
+        watch_task = asyncio.create_task(self.watchdog.watch())
 
         for port in self.ports:
             try:
                 server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                # set before listen() so accepted clients inherit it (and get a matching TCP window)
+                server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.socket_buffer_size)
+                # restart straight away instead of waiting out TIME_WAIT on the old connections
+                server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                if self.reuse_port and hasattr(socket, "SO_REUSEPORT"):
+                    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
                 server_socket.bind(('', port))
                 server_socket.listen()
                 logger.info(f"Listening on port {port}...")
@@ -317,55 +446,21 @@ class Radio:
         
         if not connect:
             logger.error("startup failure")
+            self.watchdog.running = False
+            await watch_task
             return
-        
-
-        while self.running:
-            server_socket.settimeout(5)
-            try:
-                client_connection, client_addr = server_socket.accept()
-                client_data = client_connection.recv(20000)
-            except TimeoutError:
-                continue
-            except ConnectionResetError:
-                continue
-
-            if client_data.startswith(b"CONN"): # consumer request
-                conn_thread = threading.Thread(target=self.consumer, args=(client_connection, ), daemon=True)
-                conn_thread.start()
-            elif client_data.startswith(b"STAT"): # status / "now playing"
-                conn_thread = threading.Thread(target=self.status, args=(client_connection, ), daemon=True)
-                conn_thread.start()
-            elif client_data.startswith(b"TADD"): # track addition request
-                client_data = client_data.split(b" ")
-                # TADD <AUTHKEY> <TRACK>
-                try:
-                    authkey = client_data[1]
-                    track = client_data[2]
-                except IndexError:
-                    client_connection.send(b"INVL")
-                    client_connection.close()
-                    continue
-
-                if authkey.decode() == self.api_auth_key:
-                    if not os.path.exists(track.decode()):
-                        client_connection.send(b"NFND")
-                        client_connection.close()
-                        continue
 
-                    radio.add_track(track.decode())
-                    client_connection.send(b"TADD")
-                    client_connection.close()
-
-                else:
-                    client_connection.send(b"AUTH")
-                    client_connection.close()
-                    continue
-            else:
-                logger.warning(f"bad connection: {client_data[:20]}!")
-                client_connection.close()
-
-            time.sleep(0.005)
+        # every client is served from this one thread, each only waking when its socket can take more data
+        server = await asyncio.start_server(self.handle, sock=server_socket)
+        try:
+            await asyncio.get_running_loop().create_future() # serve until we're cancelled (ctrl+c)
+        finally:
+            # not serve_forever(), that would wait on every consumer to hang up before letting us exit.
+            # the loop cancels them for us once we return.
+            self.running = False
+            server.close()
+            self.watchdog.running = False
+            await watch_task
 
 if __name__ == "__main__":
     radio = Radio("authkey")
@@ -384,16 +479,21 @@ if __name__ == "__main__":
         try:
             logger.info(f"radio playlist is of type: {playlist["media_type"]}")
 
-            # test for proper values:
-            for i, track in enumerate(playlist["tracks"]):
-                logger.info(f"loading track {i+1} of {len(playlist["tracks"])}")
-                logger.info(f"title: {str(track["title"])}")
-                logger.info(f"author: {str(track["author"])}")
-                logger.info(f"length: {int(track["length"])} seconds")
-                logger.info(f"path: '{str(track["path"])}'")
-
-                radio.add_track(track["path"])
-                radio.playlist.append(track)
+            tracks = playlist["tracks"]
+            with ThreadPoolExecutor(max_workers=max(1, min(8, len(tracks)))) as pool:
+                # read and index every track at once, but add them to the buffer one by one in playlist order
+                loads = [pool.submit(radio.load_track, track["path"]) for track in tracks]
+
+                # test for proper values:
+                for i, (track, load) in enumerate(zip(tracks, loads)):
+                    logger.info(f"loading track {i+1} of {len(tracks)}")
+                    logger.info(f"title: {str(track["title"])}")
+                    logger.info(f"author: {str(track["author"])}")
+                    logger.info(f"length: {int(track["length"])} seconds")
+                    logger.info(f"path: '{str(track["path"])}'")
+
+                    radio.commit_track(track["path"], *load.result()) # re-raises anything the load hit
+                    radio.add_to_playlist(track)
         except KeyError as e:
             logger.critical(f"invalid playlist JSON, please ensure all needed fields are present. (KeyError: {e})")
             sys.exit(1)
@@ -405,28 +505,10 @@ if __name__ == "__main__":
             sys.exit(1)
 
     logger.info("starting server...")
-    # radio.add_track("test.mp3")
-    # radio.add_track("test2.mp3")
-    # radio.add_track("test_lowbitrate.mp3")
-        # radio.buffer = radio.buffer[len(radio.buffer)-10:]
-
-    # with open("test_lowbitrate.mp3", "rb") as f:
-    #     while True:
-    #         chunk = f.read(radio.chunk_size)
-
-    #         if chunk:
-    #             # print(chunk[:10])
-    #             radio.buffer.append(chunk)
-    #         else:
-    #             break
     try:
-        radio.main()
+        asyncio.run(radio.main()) # the Watchdog runs on the event loop and stops with it
     except KeyboardInterrupt:
         logger.info("KeyboardInterrupt raised!")
-        logger.info("waiting for Watchdog and Producer to shut down...")
-        radio.watchdog.running = False
         radio.running = False
-        radio.watch_thread.join()
-        radio.producer_thread.join()
 
         logger.info(f"Radio exited successfully after {radio.up_time} sec of uptime.")